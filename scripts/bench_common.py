@@ -0,0 +1,76 @@
+"""Row parsing and JSON output shared by the benchmark scripts."""
+
+from __future__ import annotations
+
+import json
+from typing import Any, List, Optional, Tuple
+
+try:
+    # Optional DFA-based engine; same API for what we use.
+    import re2 as re  # type: ignore[import-not-found, import-untyped, unused-ignore]
+except ImportError:
+    import re
+
+try:
+    # Optional C JSON encoder; stdlib json is the fallback.
+    import orjson  # type: ignore[import-not-found, unused-ignore]
+except ImportError:
+    orjson = None  # type: ignore[assignment, unused-ignore]
+
+
+BENCH_LINE_RE = re.compile(
+    r"^(push-only|pop-only|mixed \(50/50\))\s+(\d+)\s+"
+    r"([0-9]+(?:\.[0-9]+)?)\s+([0-9]+(?:\.[0-9]+)?)\s+"
+    r"([0-9]+(?:\.[0-9]+)?)\s+([0-9]+(?:\.[0-9]+)?)\s+"
+    r"([0-9]+(?:\.[0-9]+)?)x\s+([0-9]+(?:\.[0-9]+)?)x$"
+)
+BENCH_TEST_NAMES = ("push-only", "pop-only", "mixed (50/50)")
+# Cheap C-level prefilter so log noise never reaches the row parser.
+BENCH_LINE_PREFIXES = ("push-only", "pop-only", "mixed")
+
+
+def _is_unsigned_decimal(tok: str) -> bool:
+    # Same grammar as the regex's [0-9]+(?:\.[0-9]+)?; float() alone would also
+    # accept signs, exponents, underscores, nan and inf.
+    whole, dot, frac = tok.partition(".")
+    if not (whole.isascii() and whole.isdigit()):
+        return False
+    return not dot or (frac.isascii() and frac.isdigit())
+
+
+def split_bench_line(line: str) -> Optional[Tuple[str, int, List[float]]]:
+    # Rows are fixed-format and whitespace-delimited, so plain str.split() handles
+    # the common case; the regex is only consulted for rows that don't fit.
+    tokens = line.split()
+    if not tokens:
+        return None
+    name_len = 2 if tokens[0] == "mixed" else 1
+    test = " ".join(tokens[:name_len])
+    fields = tokens[name_len:]
+    if (
+        test in BENCH_TEST_NAMES
+        and line.startswith(test)
+        and len(fields) == 7
+        and fields[0].isdecimal()
+        and fields[5].endswith("x")
+        and fields[6].endswith("x")
+    ):
+        # Strip the speedup 'x' suffixes in place so the six numeric columns are
+        # one contiguous slice for validation and conversion.
+        fields[5] = fields[5][:-1]
+        fields[6] = fields[6][:-1]
+        numeric = fields[1:]
+        if all(map(_is_unsigned_decimal, numeric)):
+            return test, int(fields[0]), list(map(float, numeric))
+
+    match = BENCH_LINE_RE.match(line)
+    if not match:
+        return None
+    return match.group(1), int(match.group(2)), [float(match.group(k)) for k in range(3, 9)]
+
+
+def dump_json(obj: Any) -> bytes:
+    if orjson is not None:
+        encoded: bytes = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        return encoded
+    return json.dumps(obj, indent=2).encode("utf-8")
@@ -4,55 +4,78 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import math
-import re
+import os
+import shutil
 import subprocess
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from bench_common import BENCH_LINE_PREFIXES, dump_json, split_bench_line
 
-ROW_RE = re.compile(
-    r"^(push-only|pop-only|mixed \(50/50\))\s+(\d+)\s+"
-    r"([0-9]+(?:\.[0-9]+)?)\s+([0-9]+(?:\.[0-9]+)?)\s+"
-    r"([0-9]+(?:\.[0-9]+)?)\s+([0-9]+(?:\.[0-9]+)?)\s+"
-    r"([0-9]+(?:\.[0-9]+)?)x\s+([0-9]+(?:\.[0-9]+)?)x$"
-)
 
+# Lines of command output kept for the failure report.
+OUTPUT_TAIL_LINES = 500
+ROW_FIELDS = ("dheap_p50", "dheap_p95", "stl_p50", "stl_p95", "spd_p50", "spd_p95")
 
-def run(cmd: List[str], cwd: Path) -> str:
-    proc = subprocess.run(
+
+def run(cmd: List[str], cwd: Path, env: Optional[Dict[str, str]] = None) -> None:
+    # Build output can be large; keep only its tail for the failure report.
+    tail: Deque[str] = deque(maxlen=OUTPUT_TAIL_LINES)
+    with subprocess.Popen(
         cmd,
         cwd=str(cwd),
-        check=False,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
         text=True,
-        capture_output=True,
-    )
+        bufsize=1,
+    ) as proc:
+        assert proc.stdout is not None
+        tail.extend(proc.stdout)
     if proc.returncode != 0:
-        sys.stderr.write(proc.stdout)
-        sys.stderr.write(proc.stderr)
+        sys.stderr.writelines(tail)
         raise RuntimeError(f"Command failed ({proc.returncode}): {' '.join(cmd)}")
-    return proc.stdout
 
 
-def parse_rows(text: str) -> Dict[Tuple[str, int], Dict[str, float]]:
-    parsed: Dict[Tuple[str, int], Dict[str, float]] = {}
-    for raw in text.splitlines():
+def run_lines(cmd: List[str], cwd: Path) -> Iterator[str]:
+    # stderr is merged in so a failing bench's diagnostics land in the tail;
+    # non-row lines are dropped by the parser's prefix check.
+    tail: Deque[str] = deque(maxlen=OUTPUT_TAIL_LINES)
+    with subprocess.Popen(
+        cmd,
+        cwd=str(cwd),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    ) as proc:
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            tail.append(line)
+            yield line
+    if proc.returncode != 0:
+        sys.stderr.writelines(tail)
+        raise RuntimeError(f"Command failed ({proc.returncode}): {' '.join(cmd)}")
+
+
+def parse_rows(lines: Iterable[str]) -> Dict[Tuple[str, int], Dict[str, float]]:
+    rows: List[Tuple[str, int, List[float]]] = []
+    for raw in lines:
         line = raw.strip()
-        m = ROW_RE.match(line)
-        if not m:
+        if not line.startswith(BENCH_LINE_PREFIXES):
             continue
-        test = m.group(1)
-        n = int(m.group(2))
-        parsed[(test, n)] = {
-            "dheap_p50": float(m.group(3)),
-            "dheap_p95": float(m.group(4)),
-            "stl_p50": float(m.group(5)),
-            "stl_p95": float(m.group(6)),
-            "spd_p50": float(m.group(7)),
-            "spd_p95": float(m.group(8)),
-        }
+        row = split_bench_line(line)
+        if row is not None:
+            rows.append(row)
+    # Insert in (test, n) order so callers can iterate the dict without re-sorting.
+    rows.sort(key=itemgetter(0, 1))
+    parsed = {(test, n): dict(zip(ROW_FIELDS, values)) for test, n, values in rows}
     if not parsed:
         raise RuntimeError("No benchmark rows parsed. Unexpected bench output format.")
     return parsed
@@ -78,30 +101,72 @@ def configure_build(
         f"-DDHEAP_ARITY={arity}",
         f"-DDHEAP_SIMD_POLICY={simd_policy}",
     ]
-    run(args, repo)
-    run(["cmake", "--build", str(build_dir), "-j"], repo)
-
-
-def bench_variant(build_dir: Path, warmup: int, iters: int, sizes: str, cwd: Path) -> str:
-    return run(
-        [
-            str(build_dir / "bench_dheap4"),
-            "--warmup",
-            str(warmup),
-            "--iters",
-            str(iters),
-            "--sizes",
-            sizes,
-        ],
-        cwd,
-    )
+    # The generator of an existing build tree can't be changed, so only pick
+    # Ninja for fresh trees.
+    if shutil.which("ninja") is not None and not (build_dir / "CMakeCache.txt").exists():
+        args += ["-G", "Ninja"]
+    env = None
+    if shutil.which("ccache") is not None:
+        # Reruns with identical flags then hit the compiler cache instead of recompiling.
+        args += [
+            "-DCMAKE_C_COMPILER_LAUNCHER=ccache",
+            "-DCMAKE_CXX_COMPILER_LAUNCHER=ccache",
+        ]
+        env = dict(os.environ)
+        env.setdefault("CCACHE_DIR", str(repo / ".ccache"))
+    else:
+        # Drop a launcher cached by an earlier run on a machine that had ccache.
+        args += ["-UCMAKE_C_COMPILER_LAUNCHER", "-UCMAKE_CXX_COMPILER_LAUNCHER"]
+    run(args, repo, env)
+    run(["cmake", "--build", str(build_dir), "--parallel", str(os.cpu_count() or 1)], repo, env)
+
+
+def bench_variant(
+    build_dir: Path,
+    warmup: int,
+    iters: int,
+    sizes: str,
+    cwd: Path,
+    cache_dir: Optional[Path] = None,
+) -> Dict[Tuple[str, int], Dict[str, float]]:
+    bench_path = build_dir / "bench_dheap4"
+    cmd = [
+        str(bench_path),
+        "--warmup",
+        str(warmup),
+        "--iters",
+        str(iters),
+        "--sizes",
+        sizes,
+    ]
+    if cache_dir is None:
+        return parse_rows(run_lines(cmd, cwd))
+
+    # Same binary bytes + same bench arguments -> reuse the recorded output.
+    binary_digest = hashlib.sha256(bench_path.read_bytes()).hexdigest()
+    key = hashlib.sha256(f"{binary_digest}:{warmup}:{iters}:{sizes}".encode("utf-8")).hexdigest()
+    cached = cache_dir / key
+    if cached.exists():
+        print(f"Reusing cached bench output: {cached}")
+        with cached.open("r", encoding="utf-8") as f:
+            return parse_rows(f)
+
+    lines = list(run_lines(cmd, cwd))
+    parsed = parse_rows(lines)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Publish via rename so an interrupted or concurrent run never leaves a
+    # truncated entry that a later run would trust.
+    tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+    tmp.write_text("".join(lines), encoding="utf-8")
+    os.replace(tmp, cached)
+    return parsed
 
 
 def print_table(
+    keys: List[Tuple[str, int]],
     simd: Dict[Tuple[str, int], Dict[str, float]],
     scalar: Dict[Tuple[str, int], Dict[str, float]],
 ) -> None:
-    keys = sorted(simd.keys(), key=lambda x: (x[0], x[1]))
     header = (
         f"{'Test':<18} {'N':>10} "
         f"{'SIMD p50':>10} {'Scalar p50':>11} {'Gain p50':>10} "
@@ -126,7 +191,7 @@ def print_table(
 def geometric_mean(values: List[float]) -> float:
     if not values:
         return 0.0
-    return math.exp(sum(math.log(v) for v in values) / len(values))
+    return math.exp(math.fsum(map(math.log, values)) / len(values))
 
 
 def parse_args() -> argparse.Namespace:
@@ -161,6 +226,11 @@ def parse_args() -> argparse.Namespace:
         choices=["HYBRID", "ALWAYS", "NEVER"],
         help="SIMD policy for the non-scalar build (default: HYBRID)",
     )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse bench output from .bench-cache/ when the binary and bench args are unchanged.",
+    )
     parser.add_argument(
         "--json",
         default="",
@@ -180,44 +250,44 @@ def main() -> int:
     scalar_dir = build_root / "simd-off"
     simd_dir.mkdir(parents=True, exist_ok=True)
     scalar_dir.mkdir(parents=True, exist_ok=True)
+    cache_dir = repo / ".bench-cache" if args.cache else None
 
-    print("Configuring/building SIMD-enabled variant...")
-    configure_build(
-        repo,
-        simd_dir,
-        force_scalar=False,
-        payload_bytes=args.payload_bytes,
-        arity=args.arity,
-        simd_policy=args.simd_policy,
-    )
-    print("Configuring/building forced-scalar variant...")
-    configure_build(
-        repo,
-        scalar_dir,
-        force_scalar=True,
-        payload_bytes=args.payload_bytes,
-        arity=args.arity,
-        simd_policy=args.simd_policy,
-    )
+    # The two build trees are independent, so configure/compile them side by side.
+    # Benchmarks below still run one at a time so they never contend for CPU.
+    print("Configuring/building SIMD-enabled and forced-scalar variants...")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        builds = [
+            pool.submit(
+                configure_build,
+                repo,
+                build_dir,
+                force_scalar=force_scalar,
+                payload_bytes=args.payload_bytes,
+                arity=args.arity,
+                simd_policy=args.simd_policy,
+            )
+            for build_dir, force_scalar in ((simd_dir, False), (scalar_dir, True))
+        ]
+        for build in builds:
+            build.result()
 
     print(
         f"Running bench (warmup={args.warmup}, iters={args.iters}, sizes={args.sizes}, "
         f"arity={args.arity}, policy={args.simd_policy}, payload={args.payload_bytes}) "
         "for SIMD-enabled variant..."
     )
-    simd_out = bench_variant(simd_dir, args.warmup, args.iters, args.sizes, repo)
+    simd = bench_variant(simd_dir, args.warmup, args.iters, args.sizes, repo, cache_dir)
     print(
         f"Running bench (warmup={args.warmup}, iters={args.iters}, sizes={args.sizes}, "
         f"arity={args.arity}, policy={args.simd_policy}, payload={args.payload_bytes}) "
         "for forced-scalar variant..."
     )
-    scalar_out = bench_variant(scalar_dir, args.warmup, args.iters, args.sizes, repo)
-
-    simd = parse_rows(simd_out)
-    scalar = parse_rows(scalar_out)
+    scalar = bench_variant(scalar_dir, args.warmup, args.iters, args.sizes, repo, cache_dir)
 
     print("\nSIMD contribution (DHeap only): gain = scalar / simd")
-    print_table(simd, scalar)
+    # parse_rows already yields rows in (test, n) order.
+    keys = list(simd)
+    print_table(keys, simd, scalar)
 
     gains_p50: List[float] = []
     gains_p95: List[float] = []
@@ -243,7 +313,7 @@ def main() -> int:
             "payload_bytes": args.payload_bytes,
             "cases": [],
         }
-        for key in sorted(simd.keys(), key=lambda x: (x[0], x[1])):
+        for key in keys:
             on = simd[key]
             off = scalar[key]
             json_payload["cases"].append(
@@ -256,7 +326,7 @@ def main() -> int:
                     "gain_p95": off["dheap_p95"] / on["dheap_p95"],
                 }
             )
-        Path(args.json).write_text(json.dumps(json_payload, indent=2), encoding="utf-8")
+        Path(args.json).write_bytes(dump_json(json_payload))
         print(f"\nWrote JSON report to: {args.json}")
 
     return 0